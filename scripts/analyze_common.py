@@ -0,0 +1,256 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from aws_common import get_client, fetch_metrics, fetch_instance_details, fetch_available_instance_types, _SIZE_RANK, _get_size_rank
+from json_utils import loads, write_json
+
+# ---------- Logical Shortlist Builder ----------
+
+def build_instance_shortlist(current_instance_type, valid_types):
+    family = current_instance_type.split('.')[0]
+    compatible_families = [family]
+    if family.startswith('t3'):
+        compatible_families += ['t4g', 't3a']
+    if family.startswith('m6'):
+        compatible_families += ['m5', 'm6i', 'm7i']
+
+    # Matching on "<family>." keeps e.g. m6i types out of an m6 shortlist
+    prefixes = tuple(f"{fam}." for fam in compatible_families)
+    shortlist = [t for t in valid_types if t.startswith(prefixes)]
+
+    # Split each type once and sort on precomputed (family rank, size rank) tuples,
+    # with unknown sizes such as metal last in their family
+    fam_rank = {fam: rank for rank, fam in enumerate(compatible_families)}
+    decorated = []
+    for t in shortlist:
+        fam, _, size = t.partition('.')
+        decorated.append((fam_rank.get(fam, 99), _SIZE_RANK.get(size, 999), t))
+    decorated.sort()
+    shortlist = [t for _, _, t in decorated]
+
+    return shortlist
+
+def pick_adjacent(current_instance_type, shortlist, decision):
+    """Returns the next size up or down within the current family, or None if there isn't one."""
+    current_family = current_instance_type.split('.')[0]
+    same_family = sorted(
+        (t for t in shortlist if t.split('.')[0] == current_family and _get_size_rank(t) >= 0),
+        key=_get_size_rank
+    )
+
+    idx = next((i for i, t in enumerate(same_family) if t == current_instance_type), None)
+    if idx is None:
+        return None
+
+    idx += 1 if decision == "upgrade" else -1
+    return same_family[idx] if 0 <= idx < len(same_family) else None
+
+def trim_shortlist(current_instance_type, shortlist, decision, limit=8, window=3):
+    """Keeps only the sizes closest to the current one in the direction of the decision."""
+    current_rank = _get_size_rank(current_instance_type)
+    if current_rank < 0:
+        return [t for t in shortlist if t != current_instance_type][:limit]
+
+    nearby = []
+    for t in shortlist:
+        rank = _get_size_rank(t)
+        if rank < 0:
+            continue
+        distance = rank - current_rank
+        if decision == "downgrade":
+            distance = -distance
+        if 0 < distance <= window:
+            nearby.append((distance, t))
+
+    # The shortlist is already ordered by family, so a stable sort on distance
+    # keeps closer families first within each size step.
+    nearby.sort(key=lambda pair: pair[0])
+    return [t for _, t in nearby[:limit]]
+
+# ---------- Batch Prompt & Response ----------
+
+def _read_json_array(pieces):
+    """Joins streamed pieces, stopping as soon as the JSON array has been closed."""
+    parts = []
+    for piece in pieces:
+        parts.append(piece)
+        if ']' in piece:
+            break
+    return ''.join(parts)
+
+# Each answer is a single {"id": ..., "suggested": ...} object of roughly 30 tokens
+# (random hex instance IDs tokenize poorly). The fixed overhead leaves room for the
+# brackets and any preamble or code fence, while still bounding cost and latency.
+_MAX_TOKENS_OVERHEAD = 64
+_MAX_TOKENS_PER_INSTANCE = 48
+
+def _max_tokens(items):
+    """Returns the completion token budget for a batch prompt covering items."""
+    return _MAX_TOKENS_OVERHEAD + _MAX_TOKENS_PER_INSTANCE * len(items)
+
+def _build_batch_prompt(items):
+    """Builds one prompt that asks for a recommendation per instance as a JSON array."""
+    instance_lines = []
+    for n, item in enumerate(items, 1):
+        current_instance_type = item['current_instance_type']
+        instance_lines.append(
+            f"{n}) id={item.get('instance_id') or n} current={current_instance_type} "
+            f"family={current_instance_type.split('.')[0]} arch={item['architecture']} "
+            f"decision={item['decision'].upper()}\n"
+            f"   options: {', '.join(trim_shortlist(current_instance_type, item['shortlist'], item['decision']))}"
+        )
+    instances = '\n'.join(instance_lines)
+
+    return f"""You are optimizing AWS EC2 instance sizing.
+
+For each instance below, recommend a new instance type that represents a logical upgrade or downgrade (next size up/down) as given by its decision, which is based on CPU usage analysis.
+Choose strictly from that instance's options and avoid unnecessary large jumps.
+
+{instances}
+
+Respond with only a JSON array containing one object per instance, for example:
+[{{"id": "i-0123456789abcdef0", "suggested": "m5.xlarge"}}]
+"""
+
+def _parse_batch_response(response, items):
+    """Maps the model's JSON array back onto items, returning None for missing entries."""
+    start, end = response.find('['), response.rfind(']')
+    try:
+        entries = loads(response[start:end + 1]) if 0 <= start < end else []
+    except ValueError:
+        entries = []
+
+    suggestions = {str(e.get('id')): e.get('suggested') for e in entries if isinstance(e, dict)}
+    return [suggestions.get(str(item.get('instance_id') or n)) for n, item in enumerate(items, 1)]
+
+def validate_instance_type(suggested_type, valid_types):
+    return suggested_type in valid_types
+
+# ---------- Recommendation Planning ----------
+
+def plan_recommendation(instance_id, region, instance_type, architecture, cpu, valid_instance_types, threshold_decision):
+    """Applies the CPU thresholds and same-family rules to one instance.
+
+    Returns the recommendation fields plus a "shortlist" entry, which is only set
+    when no rule decided the new type and the AI still has to pick one.
+    """
+    print(f"\nInstance ID: {instance_id}")
+    print(f"Current Instance Type: {instance_type}")
+    print(f"Architecture: {architecture}")
+    print(f"Average CPU Usage: {cpu:.2f}%")
+
+    decision = threshold_decision(cpu)
+    print(f"\nThreshold-based Decision: {decision.upper()}")
+
+    suggested_type = None
+    shortlist = None
+
+    if decision in ("upgrade", "downgrade"):
+        candidates = build_instance_shortlist(instance_type, valid_instance_types)
+        print(f"\nFiltered Instance Shortlist ({len(candidates)}): {candidates[:10]}...")
+        current_rank = _get_size_rank(instance_type)
+        can_downgrade = any(0 <= _get_size_rank(t) < current_rank for t in candidates)
+
+        if decision == "downgrade" and not can_downgrade:
+            print("\nThis instance is already the smallest in its family. No action needed.")
+            decision = "retain"
+        else:
+            # The next size in the same family is a rule, not a judgement call, so
+            # only fall back to the AI when the family has no neighbour to move to.
+            suggested_type = pick_adjacent(instance_type, candidates, decision)
+            if suggested_type:
+                print(f"\nNext Size In Family: {suggested_type}")
+            elif trim_shortlist(instance_type, candidates, decision):
+                shortlist = candidates
+            else:
+                print(f"\nNo compatible instance type available to {decision} to. No action needed.")
+                decision = "retain"
+    else:
+        print("\nNo resizing required based on thresholds.")
+
+    return {
+        "instance_id": instance_id,
+        "region": region,
+        "current_instance_type": instance_type,
+        "architecture": architecture,
+        "average_cpu_usage_percent": round(cpu, 2),
+        "decision": decision,
+        "ai_suggested_instance_type": suggested_type,
+        "shortlist": shortlist
+    }
+
+def finalize_recommendation(plan, valid_instance_types, provider="AI"):
+    """Validates the suggested type and returns the result saved for the resize step."""
+    result = {k: v for k, v in plan.items() if k != "shortlist"}
+    suggested_type = result["ai_suggested_instance_type"]
+    validated = validate_instance_type(suggested_type, valid_instance_types)
+
+    # Check validation and print final result
+    if validated:
+        print(f"\n✅ {result['instance_id']}: Recommendation Validated: Proceed to {result['decision']} to {suggested_type}")
+    elif suggested_type:
+        print(f"\n❌ WARNING: {result['instance_id']}: {provider} suggested invalid instance type ({suggested_type}). Action aborted.")
+
+    result["ai_suggested_instance_type"] = suggested_type if suggested_type else None
+    result["validated"] = validated
+    result["action_required"] = validated
+    return result
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Recommends EC2 instance resizes based on CPU usage.")
+    ids = parser.add_mutually_exclusive_group(required=True)
+    ids.add_argument('--instance-ids', help="Comma-separated EC2 instance IDs")
+    ids.add_argument('--from-file', help="File with one EC2 instance ID per line")
+    parser.add_argument('--region', required=True, help="AWS region (e.g. us-east-1)")
+    parser.add_argument('--concurrency', type=int, default=8, help="Maximum number of concurrent AWS calls")
+    args = parser.parse_args()
+
+    if args.from_file:
+        with open(args.from_file) as f:
+            args.instance_ids = [line.strip() for line in f if line.strip()]
+    else:
+        args.instance_ids = [i.strip() for i in args.instance_ids.split(',') if i.strip()]
+    return args
+
+# ---------- Main Execution ----------
+
+def run_analysis(threshold_decision, suggest_batch, provider="AI"):
+    """Runs the analysis CLI with an analyzer's CPU thresholds and batch suggestion call."""
+    args = parse_args()
+    region = args.region
+
+    # Clients are created up front in the main thread since boto3 clients
+    # (unlike the sessions that build them) are safe to use across threads.
+    ec2_client = get_client('ec2', region)
+    cloudwatch_client = get_client('cloudwatch', region)
+
+    # Instance details and CPU metrics are independent round-trips, so every
+    # instance's calls are submitted up front and run concurrently.
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        details_futures = [executor.submit(fetch_instance_details, i, region, ec2_client) for i in args.instance_ids]
+        cpu_futures = [executor.submit(fetch_metrics, i, region, cloudwatch_client) for i in args.instance_ids]
+
+        plans = []
+        for instance_id, details_future, cpu_future in zip(args.instance_ids, details_futures, cpu_futures):
+            # The instance types lookup needs the architecture, so it overlaps with
+            # the outstanding calls; repeats are served from the in-process cache.
+            instance_type, architecture = details_future.result()
+            valid_instance_types = fetch_available_instance_types(region, architecture, client=ec2_client)
+            plan = plan_recommendation(instance_id, region, instance_type, architecture, cpu_future.result(), valid_instance_types, threshold_decision)
+            plans.append((plan, valid_instance_types))
+
+    # A single AI call covers every instance that still needs a suggestion
+    pending = [plan for plan, _ in plans if plan["shortlist"]]
+    if pending:
+        for plan, suggested_type in zip(pending, suggest_batch(pending)):
+            plan["ai_suggested_instance_type"] = suggested_type
+            if suggested_type:
+                print(f"\n{plan['instance_id']}: {provider} Suggested Instance Type: {suggested_type}")
+            else:
+                print(f"\n⚠️ WARNING: {plan['instance_id']}: No suggestion returned by {provider}. Action aborted.")
+
+    results = [finalize_recommendation(plan, valid_instance_types, provider) for plan, valid_instance_types in plans]
+
+    # A single instance keeps the original object layout the workflows read
+    write_json("resize_recommendation.json", results[0] if len(results) == 1 else results)
+
+    print("\n✅ Output saved to resize_recommendation.json")
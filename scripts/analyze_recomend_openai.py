@@ -1,105 +1,12 @@
-import boto3
 import os
-import json
-from datetime import datetime, timedelta, timezone
-import requests
+import time
+import httpx
 from dotenv import load_dotenv
+from analyze_common import _read_json_array, _build_batch_prompt, _max_tokens, _parse_batch_response, run_analysis
+from json_utils import loads
 
 load_dotenv()
 
-# ---------- AWS Metrics & Instance Info ----------
-#Fetches average hourly CPU utilization for the past 7 days from CloudWatch for a specific EC2 instance
-def fetch_metrics(instance_id, region):
-    client = boto3.client('cloudwatch', region_name=region)
-    resp = client.get_metric_statistics(
-        Namespace='AWS/EC2',
-        MetricName='CPUUtilization',
-        Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
-        StartTime=datetime.now(timezone.utc) - timedelta(days=7),
-        EndTime=datetime.now(timezone.utc),
-        Period=3600,
-        Statistics=['Average']
-    )
-    datapoints = [d['Average'] for d in resp['Datapoints']]
-    return sum(datapoints) / len(datapoints) if datapoints else 0
-
-def fetch_instance_details(instance_id, region):
-    client = boto3.client('ec2', region_name=region)
-    reservations = client.describe_instances(InstanceIds=[instance_id])['Reservations']
-    instance = reservations[0]['Instances'][0]
-    return instance['InstanceType'], instance['Architecture']
-
-# ---------- Instance Types Cache ----------
-
-def fetch_available_instance_types(region, architecture, cache_file='instance_types_cache.json'):
-    now = datetime.now(timezone.utc) 
-
-    if os.path.exists(cache_file):
-        with open(cache_file) as f:
-            cache = json.load(f)
-            key = f"{region}_{architecture}"
-
-            if key in cache:
-                last_updated_str = cache[key].get('last_updated')
-                if last_updated_str:
-                    last_updated = datetime.strptime(last_updated_str, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
-                    if now - last_updated < timedelta(hours=23):
-                        return cache[key]['instance_types']
-
-    ec2 = boto3.client('ec2', region_name=region)
-    paginator = ec2.get_paginator('describe_instance_types')
-    valid_types = []
-
-    for page in paginator.paginate():
-        for itype in page['InstanceTypes']:
-            if architecture in itype['ProcessorInfo']['SupportedArchitectures']:
-                valid_types.append(itype['InstanceType'])
-
-    key = f"{region}_{architecture}"
-    if os.path.exists(cache_file):
-        with open(cache_file) as f:
-            cache = json.load(f)
-    else:
-        cache = {}
-
-    cache[key] = {
-        'last_updated': now.strftime("%Y-%m-%dT%H:%M:%SZ"),
-        'instance_types': valid_types
-    }
-
-    with open(cache_file, 'w') as f:
-        json.dump(cache, f, indent=2)
-
-    return valid_types
-
-# ---------- Logical Shortlist Builder ----------
-
-def build_instance_shortlist(current_instance_type, valid_types):
-    family = current_instance_type.split('.')[0]
-    sizes = ['nano', 'micro', 'small', 'medium', 'large', 'xlarge', '2xlarge', '4xlarge', '8xlarge', '16xlarge', '32xlarge', '48xlarge']
-
-    # Detect current size
-    current_size = current_instance_type.split('.')[1]
-
-    # Build shortlist: same family + compatible families
-    compatible_families = [family]
-    if family.startswith('t3'):
-        compatible_families += ['t4g', 't3a']
-    if family.startswith('m6'):
-        compatible_families += ['m5', 'm6i', 'm7i']
-
-    # Shortlist: only same/compatible families
-    shortlist = [t for t in valid_types if any(t.startswith(fam) for fam in compatible_families)]
-
-    # Sort shortlist logically (family-wise + size-wise)
-    def size_rank(t):
-        size = t.split('.')[1]
-        return sizes.index(size) if size in sizes else 999
-
-    shortlist = sorted(shortlist, key=lambda t: (compatible_families.index(t.split('.')[0]) if t.split('.')[0] in compatible_families else 99, size_rank(t)))
-
-    return shortlist
-
 # ---------- CPU Threshold Logic ----------
 
 def threshold_decision(cpu):
@@ -112,8 +19,49 @@ def threshold_decision(cpu):
 
 # ---------- OpenAI Suggestion ----------
 
-def ai_suggest_instance_type(current_instance_type, architecture, decision, shortlist):
-    api_key = os.getenv('API_KEY')
+_REQUEST_TIMEOUT = 20.0
+
+# Shared HTTP/2 client so repeated calls are multiplexed over one connection.
+# The transport only retries failed connections, so throttling and transient
+# server errors are retried with backoff in _stream_completion.
+_HTTPX = httpx.Client(
+    timeout=_REQUEST_TIMEOUT,
+    headers={'api-key': os.getenv('API_KEY') or '', 'Content-Type': 'application/json'},
+    transport=httpx.HTTPTransport(http2=True, retries=3)
+)
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def _stream_completion(url, payload, retries=3, backoff=0.5):
+    """Yields streamed content deltas, backing off exponentially on throttling and 5xx responses."""
+    for attempt in range(retries + 1):
+        with _HTTPX.stream('POST', url, json=payload) as response:
+            retry = response.status_code in _RETRY_STATUSES and attempt < retries
+            if not retry:
+                # Surface auth, quota and exhausted-retry failures instead of
+                # letting them look like an empty model answer
+                if response.is_error:
+                    response.read()
+                    print(f"\n❌ AI request failed with HTTP {response.status_code}: {response.text}")
+                    return
+                for line in response.iter_lines():
+                    if not line.startswith('data: '):
+                        continue
+                    data = line[len('data: '):]
+                    if data == '[DONE]':
+                        return
+                    choices = loads(data).get('choices')
+                    content = choices[0].get('delta', {}).get('content') if choices else None
+                    if content:
+                        yield content
+                return
+        time.sleep(backoff * 2 ** attempt)
+
+def ai_suggest_instance_types_batch(items):
+    """Asks the model for instance type suggestions for several instances in a single call.
+
+    Each item is a dict with current_instance_type, architecture, decision, shortlist
+    and optionally instance_id. Returns the suggestions in the same order as items.
+    """
     api_url = os.getenv('API_URL')
     api_ver = os.getenv('API_VER')
     api_model = os.getenv('API_MODEL')
@@ -122,100 +70,40 @@ def ai_suggest_instance_type(current_instance_type, architecture, decision, shor
     # Define the URL for the chat completion endpoint
     url = f"{api_url}/v1/{app_id}/openai/deployments/{api_model}/chat/completions?api_version={api_ver}"
 
-    shortlist_trimmed = ', '.join(shortlist[:20])
-    current_family = current_instance_type.split('.')[0]
-
-    prompt = f"""You are optimizing AWS EC2 instance sizing.
-
-Current instance type: {current_instance_type}
-Architecture: {architecture}
-Action recommended: {decision.upper()} (based on CPU usage analysis).
-Instance family: {current_family}
-
-Available options for {architecture} in this region (choose strictly from this list):
-{shortlist_trimmed}
-
-Recommend a new instance type that represents a logical {decision} (next size up/down). Avoid unnecessary large jumps.
-
-Respond with only the instance type name."""
-
-    payload = json.dumps({
+    payload = {
         "messages": [
             {"role": "system", "content": "You are a helpful assistant within the Spark Assist platform."},
-            {"role": "user", "content": prompt}
+            {"role": "user", "content": _build_batch_prompt(items)}
         ],
         "temperature": 0.2,
+        "max_tokens": _max_tokens(items),
         "n": 1,
-        "stream": False,
+        "stream": True,
         "presence_penalty": 0,
         "frequency_penalty": 0,
         "top_p": 1
-    })
-
-    headers = {
-        'api-key': api_key,
-        'Content-Type': 'application/json'
     }
 
-    response = requests.post(url, headers=headers, data=payload)
-    response_data = response.json()
-
-    if 'choices' in response_data and len(response_data['choices']) > 0:
-        return response_data['choices'][0]['message']['content'].strip()
-    else:
-        return None
-
-def validate_instance_type(suggested_type, valid_types):
-    return suggested_type in valid_types
-
-# ---------- Main Execution ----------
-
-if __name__ == "__main__":
-    instance_id = input("Enter EC2 Instance ID: ")
-    region = input("Enter AWS Region (e.g. us-east-1): ")
-
-    instance_type, architecture = fetch_instance_details(instance_id, region)
-    valid_instance_types = fetch_available_instance_types(region, architecture)
-    cpu = fetch_metrics(instance_id, region)
+    # Stop reading as soon as the answer is complete; closing the generator
+    # also closes the underlying response.
+    pieces = _stream_completion(url, payload)
+    try:
+        response = _read_json_array(pieces).strip()
+    finally:
+        pieces.close()
 
-    print(f"\nCurrent Instance Type: {instance_type}")
-    print(f"Architecture: {architecture}")
-    print(f"Average CPU Usage: {cpu:.2f}%")
+    return _parse_batch_response(response, items)
 
-    decision = threshold_decision(cpu)
-    print(f"\nThreshold-based Decision: {decision.upper()}")
-
-    suggested_type = None
-    validated = False
-
-    if decision in ["upgrade", "downgrade"]:
-        shortlist = build_instance_shortlist(instance_type, valid_instance_types)
-        print(f"\nFiltered Instance Shortlist ({len(shortlist)}): {shortlist[:10]}...")
-
-        suggested_type = ai_suggest_instance_type(instance_type, architecture, decision, shortlist)
-        print(f"\nAI Suggested Instance Type: {suggested_type}")
-
-        validated = validate_instance_type(suggested_type, valid_instance_types)
-        if validated:
-            print(f"\n✅ Recommendation Validated: Proceed to {decision} to {suggested_type}")
-        else:
-            print(f"\n❌ WARNING: AI suggested invalid instance type ({suggested_type}). Action aborted.")
-    else:
-        print("\nNo resizing required based on thresholds.")
-
-    result = {
-        "instance_id": instance_id,
-        "region": region,
-        "current_instance_type": instance_type,
+def ai_suggest_instance_type(current_instance_type, architecture, decision, shortlist):
+    item = {
+        "current_instance_type": current_instance_type,
         "architecture": architecture,
-        "average_cpu_usage_percent": round(cpu, 2),
         "decision": decision,
-        "ai_suggested_instance_type": suggested_type if suggested_type else None,
-        "validated": validated,
-        "action_required": validated
+        "shortlist": shortlist
     }
+    return ai_suggest_instance_types_batch([item])[0]
 
-    with open("resize_recommendation.json", "w") as f:
-        json.dump(result, f, indent=2)
+# ---------- Main Execution ----------
 
-    print("\n✅ Output saved to resize_recommendation.json")
\ No newline at end of file
+if __name__ == "__main__":
+    run_analysis(threshold_decision, ai_suggest_instance_types_batch, "AI")
@@ -0,0 +1,194 @@
+import boto3
+from botocore.config import Config
+import functools
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from statistics import fmean
+from json_utils import read_json, write_json_atomic
+
+# ---------- AWS Clients ----------
+
+# Larger connection pool and keep-alive so back-to-back and concurrent calls reuse
+# connections, with adaptive retries to absorb API throttling.
+BOTO_CONFIG = Config(
+    max_pool_connections=50,
+    retries={'mode': 'adaptive', 'max_attempts': 10},
+    tcp_keepalive=True
+)
+
+# Poll instance and volume state changes every 3s instead of the default 15s,
+# keeping botocore's default 10 minute budget (15s x 40) before giving up
+WAITER_CONFIG = {'Delay': 3, 'MaxAttempts': 200}
+
+@functools.lru_cache(maxsize=None)
+def get_client(service, region):
+    """Returns a boto3 client per service and region, built once and reused."""
+    return boto3.client(service, region_name=region, config=BOTO_CONFIG)
+
+# ---------- AWS Metrics & Instance Info ----------
+
+def fetch_metrics(instance_id, region, client=None):
+    """Fetches average CPU utilization from CloudWatch for the last 7 days."""
+    client = client or get_client('cloudwatch', region)
+    resp = client.get_metric_statistics(
+        Namespace='AWS/EC2',
+        MetricName='CPUUtilization',
+        Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
+        StartTime=datetime.now(timezone.utc) - timedelta(days=7),
+        EndTime=datetime.now(timezone.utc),
+        Period=86400,
+        Statistics=['Average']
+    )
+    datapoints = resp['Datapoints']
+    return fmean(d['Average'] for d in datapoints) if datapoints else 0
+
+@functools.lru_cache(maxsize=32)
+def describe_instance(instance_id, region, client=None, retries=5, backoff=0.5):
+    """Returns the instance description, retrying with exponential backoff while
+    EC2's eventually consistent API returns an empty or incomplete response.
+
+    Results are memoized so one process describes each instance once; call
+    describe_instance.cache_clear() after stopping, starting or modifying it.
+    """
+    client = client or get_client('ec2', region)
+    for attempt in range(retries + 1):
+        try:
+            return client.describe_instances(InstanceIds=[instance_id])['Reservations'][0]['Instances'][0]
+        except (IndexError, KeyError) as e:
+            if attempt == retries:
+                raise ValueError(f"Instance ID {instance_id} not found.") from e
+            time.sleep(min(backoff * 2 ** attempt, 8))
+
+def fetch_instance_details(instance_id, region, client=None):
+    """Fetches the current instance type and architecture."""
+    instance = describe_instance(instance_id, region, client)
+    return instance['InstanceType'], instance['Architecture']
+
+def fetch_supported_architectures(instance_type, region, client=None):
+    """Returns the architectures an instance type supports, or [] if it is not offered."""
+    client = client or get_client('ec2', region)
+    try:
+        itypes = client.describe_instance_types(InstanceTypes=[instance_type])['InstanceTypes']
+    except client.exceptions.ClientError as e:
+        if e.response['Error']['Code'] == 'InvalidInstanceType':
+            return []
+        raise
+    if not itypes:
+        return []
+    return itypes[0].get('ProcessorInfo', {}).get('SupportedArchitectures', [])
+
+# ---------- Instance Types Cache ----------
+
+# In-process memo of instance type lists keyed by "<region>_<architecture>",
+# plus the last parsed cache file keyed by path and guarded by its mtime.
+_CACHE = {}
+_CACHE_FILES = {}
+_CACHE_LOCK = threading.Lock()
+
+def _load_cache_file(cache_file):
+    """Returns the parsed cache file, re-reading it only when its mtime changes."""
+    try:
+        mtime = os.stat(cache_file).st_mtime
+    except FileNotFoundError:
+        return {}
+    cached = _CACHE_FILES.get(cache_file)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    cache = read_json(cache_file)
+    _CACHE_FILES[cache_file] = (mtime, cache)
+    return cache
+
+def _write_cache_file(cache_file, cache):
+    """Writes the cache compactly via a temp file and an atomic rename."""
+    write_json_atomic(cache_file, cache)
+    _CACHE_FILES[cache_file] = (os.stat(cache_file).st_mtime, cache)
+
+def _parse_timestamp(value):
+    # Entries written before the switch to isoformat end in "Z" and carry no offset
+    parsed = datetime.fromisoformat(value.rstrip('Z'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def _format_timestamp(value):
+    return value.isoformat(timespec='seconds')
+
+def _probe_instance_types(ec2, architecture):
+    """Returns a short hash of the first page of instance types for an architecture.
+
+    This is a single small request, used to check whether a stale cache entry can
+    be kept instead of walking every page again.
+    """
+    resp = ec2.describe_instance_types(
+        Filters=[{'Name': 'processor-info.supported-architecture', 'Values': [architecture]}],
+        MaxResults=5
+    )
+    instance_types = sorted(itype['InstanceType'] for itype in resp['InstanceTypes'])
+    return hashlib.sha256(','.join(instance_types).encode()).hexdigest()[:16]
+
+def fetch_available_instance_types(region, architecture, cache_file='instance_types_cache.json', client=None):
+    """Fetches and caches all valid instance types for a given architecture and region."""
+    now = datetime.now(timezone.utc)
+    key = f"{region}_{architecture}"
+
+    with _CACHE_LOCK:
+        memo = _CACHE.get(key)
+        if memo and now - memo[0] < timedelta(hours=23):
+            return memo[1]
+
+        cache = _load_cache_file(cache_file)
+        entry = cache.get(key, {})
+        last_updated_str = entry.get('last_updated')
+        if last_updated_str:
+            last_updated = _parse_timestamp(last_updated_str)
+            if now - last_updated < timedelta(hours=23):
+                _CACHE[key] = (last_updated, entry['instance_types'])
+                return entry['instance_types']
+
+        ec2 = client or get_client('ec2', region)
+
+        # A stale entry is revalidated with a one-page probe and only re-fetched in
+        # full when the probe changed. The probe cannot see types added beyond its
+        # first page, so a full refresh is still forced once a week.
+        last_refreshed_str = entry.get('last_refreshed')
+        if entry.get('probe_etag') and last_refreshed_str and now - _parse_timestamp(last_refreshed_str) < timedelta(days=7):
+            if _probe_instance_types(ec2, architecture) == entry['probe_etag']:
+                entry['last_updated'] = _format_timestamp(now)
+                _write_cache_file(cache_file, cache)
+                _CACHE[key] = (now, entry['instance_types'])
+                return entry['instance_types']
+
+        paginator = ec2.get_paginator('describe_instance_types')
+        # Let EC2 filter by architecture server-side instead of pulling every type.
+        pages = paginator.paginate(
+            Filters=[{'Name': 'processor-info.supported-architecture', 'Values': [architecture]}],
+            PaginationConfig={'PageSize': 100}
+        )
+        valid_types = [itype['InstanceType'] for page in pages for itype in page['InstanceTypes']]
+
+        cache[key] = {
+            'last_updated': _format_timestamp(now),
+            'last_refreshed': _format_timestamp(now),
+            'probe_etag': _probe_instance_types(ec2, architecture),
+            'instance_types': valid_types
+        }
+        _write_cache_file(cache_file, cache)
+        _CACHE[key] = (now, valid_types)
+
+    return valid_types
+
+# ---------- Instance Sizes ----------
+
+# Every numeric size in ascending order, so "next size" never skips one (e.g.
+# 8xlarge -> 12xlarge). Non-size suffixes such as metal are left unranked.
+_SIZES = (
+    'nano', 'micro', 'small', 'medium', 'large', 'xlarge',
+    '2xlarge', '3xlarge', '4xlarge', '6xlarge', '8xlarge', '9xlarge', '10xlarge', '12xlarge',
+    '16xlarge', '18xlarge', '24xlarge', '32xlarge', '48xlarge', '56xlarge', '96xlarge', '112xlarge', '224xlarge'
+)
+_SIZE_RANK = {size: rank for rank, size in enumerate(_SIZES)}
+
+def _get_size_rank(instance_type):
+    """Internal helper to get a numerical rank for instance size."""
+    return _SIZE_RANK.get(instance_type.partition('.')[2], -1) # Return -1 for unknown sizes
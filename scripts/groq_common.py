@@ -0,0 +1,10 @@
+import functools
+import os
+from groq import Groq
+
+# ---------- Groq Client ----------
+
+@functools.lru_cache(maxsize=None)
+def get_groq_client(timeout=20.0):
+    """Returns a shared Groq client per timeout so its connection pool is reused across calls."""
+    return Groq(api_key=os.environ.get("GROQ_API_KEY"), timeout=timeout, max_retries=3)
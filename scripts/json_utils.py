@@ -0,0 +1,57 @@
+import json
+import os
+import stat
+import tempfile
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The process umask, read once at import since os.umask can only be read by setting it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# ---------- JSON Serialization ----------
+
+def dumps(obj):
+    """Serializes obj to compact JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+def loads(data):
+    """Parses JSON from bytes or str, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def read_json(path):
+    """Reads and parses the JSON file at path in a single read."""
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+def write_json(path, obj):
+    """Writes obj to path as compact JSON in a single write."""
+    with open(path, 'wb') as f:
+        f.write(dumps(obj))
+
+def write_json_atomic(path, obj):
+    """Writes obj to path via a synced temp file and a rename, so readers never see a partial file."""
+    with tempfile.NamedTemporaryFile(mode='wb', dir=os.path.dirname(path) or '.', delete=False) as tmp:
+        try:
+            tmp.write(dumps(obj))
+            tmp.flush()
+            os.fsync(tmp.fileno())
+            # NamedTemporaryFile creates files as 0600; keep the target's mode, or
+            # what a plain open() would have given a new file
+            try:
+                mode = stat.S_IMODE(os.stat(path).st_mode)
+            except FileNotFoundError:
+                mode = 0o666 & ~_UMASK
+            os.chmod(tmp.name, mode)
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+    os.replace(tmp.name, path)
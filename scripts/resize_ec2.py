@@ -1,12 +1,12 @@
-import boto3
-import json
 import sys
+from aws_common import get_client, describe_instance, WAITER_CONFIG
+from json_utils import read_json, write_json_atomic
 
 def resize_instance(instance_id, region, new_type):
-    ec2 = boto3.client('ec2', region_name=region)
+    ec2 = get_client('ec2', region)
 
     # Get current instance info
-    instance_info = ec2.describe_instances(InstanceIds=[instance_id])['Reservations'][0]['Instances'][0]
+    instance_info = describe_instance(instance_id, region)
     current_type = instance_info['InstanceType']
     architecture = instance_info['Architecture']
     state = instance_info['State']['Name']
@@ -32,15 +32,18 @@ def resize_instance(instance_id, region, new_type):
             sys.exit(1)
 
     # ✅ Stop the instance if running
-    if state != 'stopped':
+    needs_stop = state != 'stopped'
+    if needs_stop:
         print("🔻 Stopping instance...")
         ec2.stop_instances(InstanceIds=[instance_id])
-        ec2.get_waiter('instance_stopped').wait(InstanceIds=[instance_id])
-        print("✅ Instance stopped.")
+        describe_instance.cache_clear()
+
+    # ✅ Save rollback info while the instance is stopping
+    write_json_atomic('rollback.json', {'previous_instance_type': current_type})
 
-    # ✅ Save rollback info
-    with open('rollback.json', 'w') as f:
-        json.dump({'previous_instance_type': current_type}, f)
+    if needs_stop:
+        ec2.get_waiter('instance_stopped').wait(InstanceIds=[instance_id], WaiterConfig=WAITER_CONFIG)
+        print("✅ Instance stopped.")
 
     # ✅ Resize instance
     print(f"🔧 Changing instance type to {new_type}...")
@@ -48,15 +51,117 @@ def resize_instance(instance_id, region, new_type):
         InstanceId=instance_id,
         InstanceType={'Value': new_type}
     )
+    describe_instance.cache_clear()
     print(f"✅ Instance type changed from {current_type} to {new_type}.")
 
     # ✅ Start the instance again
     ec2.start_instances(InstanceIds=[instance_id])
+    describe_instance.cache_clear()
     print("🚀 Instance started successfully.")
 
+def resize_many(targets, region):
+    """Resizes several instances, mapping instance ID to new type, with one stop, start and wait for all of them."""
+    ec2 = get_client('ec2', region)
+
+    # ✅ Describe every instance in one call rather than one call per instance
+    pages = ec2.get_paginator('describe_instances').paginate(InstanceIds=list(targets))
+    instances = {
+        instance['InstanceId']: instance
+        for page in pages
+        for reservation in page['Reservations']
+        for instance in reservation['Instances']
+    }
+
+    previous_types = {}
+    needs_stop = []
+    for instance_id, new_type in targets.items():
+        instance_info = instances[instance_id]
+        current_type = instance_info['InstanceType']
+        print(f"{instance_id}: Current Type: {current_type} | Target Type: {new_type}")
+        if current_type == new_type:
+            print(f"⚠️ No action needed: {instance_id} is already of type '{current_type}'.")
+            continue
+        previous_types[instance_id] = current_type
+        if instance_info['State']['Name'] != 'stopped':
+            needs_stop.append(instance_id)
+
+    if not previous_types:
+        return
+    instance_ids = list(previous_types)
+
+    # ✅ Dry run to check permissions before stopping anything
+    for instance_id in instance_ids:
+        try:
+            ec2.modify_instance_attribute(
+                InstanceId=instance_id,
+                InstanceType={'Value': targets[instance_id]},
+                DryRun=True
+            )
+        except ec2.exceptions.ClientError as e:
+            if 'DryRunOperation' not in str(e):
+                print(f"❌ Dry-run failed for {instance_id}: {e}")
+                sys.exit(1)
+    print("✅ Dry-run passed. Proceeding with resize...")
+
+    # ✅ Stop all running instances in one call
+    if needs_stop:
+        print(f"🔻 Stopping {len(needs_stop)} instance(s)...")
+        ec2.stop_instances(InstanceIds=needs_stop)
+        describe_instance.cache_clear()
+
+    # ✅ Save rollback info while the instances are stopping
+    write_json_atomic('rollback.json', {'previous_instance_types': previous_types})
+
+    if needs_stop:
+        ec2.get_waiter('instance_stopped').wait(InstanceIds=needs_stop, WaiterConfig=WAITER_CONFIG)
+        print("✅ Instances stopped.")
+
+    # ✅ Resize each instance; the API takes one instance per call. A failure on one
+    # instance must not leave the rest of the batch stopped, so they are always
+    # started again and the failures are reported afterwards.
+    failures = {}
+    try:
+        for instance_id in instance_ids:
+            try:
+                ec2.modify_instance_attribute(
+                    InstanceId=instance_id,
+                    InstanceType={'Value': targets[instance_id]}
+                )
+                print(f"✅ {instance_id}: Instance type changed from {previous_types[instance_id]} to {targets[instance_id]}.")
+            except ec2.exceptions.ClientError as e:
+                failures[instance_id] = e
+                print(f"❌ {instance_id}: Failed to change instance type to {targets[instance_id]}: {e}")
+    finally:
+        describe_instance.cache_clear()
+
+        # ✅ Start all instances again in one call
+        ec2.start_instances(InstanceIds=instance_ids)
+        describe_instance.cache_clear()
+
+    ec2.get_waiter('instance_running').wait(InstanceIds=instance_ids, WaiterConfig=WAITER_CONFIG)
+    print(f"🚀 {len(instance_ids)} instance(s) started successfully.")
+
+    if failures:
+        print(f"❌ {len(failures)} of {len(instance_ids)} instance(s) kept their previous type:")
+        for instance_id, error in failures.items():
+            print(f"   {instance_id} ({previous_types[instance_id]}): {error}")
+        sys.exit(1)
+
 if __name__ == "__main__":
-    with open('resize_recommendation.json') as f:
-        outputs = json.load(f)
+    outputs = read_json('resize_recommendation.json')
+
+    # A batch analysis run saves a list of recommendations for one region
+    if isinstance(outputs, list):
+        targets = {
+            output['instance_id']: output['ai_suggested_instance_type']
+            for output in outputs
+            if output.get('action_required') and output.get('ai_suggested_instance_type')
+        }
+        if not targets:
+            print("⚠️ No action needed: no validated recommendations to apply.")
+            sys.exit(0)
+        resize_many(targets, outputs[0]['region'])
+        sys.exit(0)
 
     instance_id = outputs['instance_id']
     region = outputs['region']
@@ -1,11 +1,11 @@
-import boto3
-import json
 import sys
+from aws_common import get_client, describe_instance, WAITER_CONFIG
+from json_utils import read_json, write_json_atomic
 
 def resize_instance(instance_id, region, new_type, requester, approver):
-    ec2 = boto3.client('ec2', region_name=region)
+    ec2 = get_client('ec2', region)
 
-    instance_info = ec2.describe_instances(InstanceIds=[instance_id])['Reservations'][0]['Instances'][0]
+    instance_info = describe_instance(instance_id, region)
     current_type = instance_info['InstanceType']
     architecture = instance_info['Architecture']
     state = instance_info['State']['Name']
@@ -31,15 +31,18 @@ def resize_instance(instance_id, region, new_type, requester, approver):
             print(f"❌ Dry-run failed: {e}")
             sys.exit(1)
 
-    if state != 'stopped':
+    needs_stop = state != 'stopped'
+    if needs_stop:
         print("🔻 Stopping instance...")
         ec2.stop_instances(InstanceIds=[instance_id])
-        ec2.get_waiter('instance_stopped').wait(InstanceIds=[instance_id])
-        print("✅ Instance stopped.")
+        describe_instance.cache_clear()
+
+    # Save rollback info while the instance is stopping
+    write_json_atomic('rollback.json', {'previous_instance_type': current_type})
 
-    # Save rollback info
-    with open('rollback.json', 'w') as f:
-        json.dump({'previous_instance_type': current_type}, f)
+    if needs_stop:
+        ec2.get_waiter('instance_stopped').wait(InstanceIds=[instance_id], WaiterConfig=WAITER_CONFIG)
+        print("✅ Instance stopped.")
 
     # Modify instance type
     print(f"🔧 Changing instance type to {new_type} (override requested)...")
@@ -47,15 +50,16 @@ def resize_instance(instance_id, region, new_type, requester, approver):
         InstanceId=instance_id,
         InstanceType={'Value': new_type}
     )
+    describe_instance.cache_clear()
     print(f"✅ Instance type changed from {current_type} to {new_type}.")
 
     # Start instance
     ec2.start_instances(InstanceIds=[instance_id])
+    describe_instance.cache_clear()
     print("🚀 Instance started successfully.")
 
 if __name__ == "__main__":
-    with open('input.json') as f:
-        data = json.load(f)
+    data = read_json('input.json')
 
     instance_id = data['instance_id']
     region = data['region']
@@ -1,21 +1,15 @@
-import boto3
-import json
 import sys
+from aws_common import get_client, describe_instance, fetch_supported_architectures, WAITER_CONFIG
+from json_utils import read_json, write_json_atomic
 
 def check_instance_type_supported(region, instance_type, architecture):
-    ec2 = boto3.client('ec2', region_name=region)
-    paginator = ec2.get_paginator('describe_instance_types')
-    for page in paginator.paginate():
-        for itype in page['InstanceTypes']:
-            if itype['InstanceType'] == instance_type:
-                arch_supported = architecture in itype.get('ProcessorInfo', {}).get('SupportedArchitectures', [])
-                return arch_supported
-    return False
+    # Look the type up directly rather than paginating through every type
+    return architecture in fetch_supported_architectures(instance_type, region)
 
 def resize_instance(instance_id, region, new_type):
-    ec2 = boto3.client('ec2', region_name=region)
+    ec2 = get_client('ec2', region)
 
-    instance_info = ec2.describe_instances(InstanceIds=[instance_id])['Reservations'][0]['Instances'][0]
+    instance_info = describe_instance(instance_id, region)
     current_type = instance_info['InstanceType']
     architecture = instance_info['Architecture']
 
@@ -37,25 +31,30 @@ def resize_instance(instance_id, region, new_type):
             print(f"Dry-run failed: {e}")
             sys.exit(1)
 
-    if instance_info['State']['Name'] != 'stopped':
+    needs_stop = instance_info['State']['Name'] != 'stopped'
+    if needs_stop:
         ec2.stop_instances(InstanceIds=[instance_id])
-        ec2.get_waiter('instance_stopped').wait(InstanceIds=[instance_id])
+        describe_instance.cache_clear()
 
-    with open('rollback.json', 'w') as f:
-        json.dump({'previous_instance_type': current_type}, f)
+    # Save rollback info while the instance is stopping
+    write_json_atomic('rollback.json', {'previous_instance_type': current_type})
+
+    if needs_stop:
+        ec2.get_waiter('instance_stopped').wait(InstanceIds=[instance_id], WaiterConfig=WAITER_CONFIG)
 
     ec2.modify_instance_attribute(
         InstanceId=instance_id,
         InstanceType={'Value': new_type}
     )
+    describe_instance.cache_clear()
     print(f"Instance type changed from {current_type} to {new_type}.")
 
     ec2.start_instances(InstanceIds=[instance_id])
+    describe_instance.cache_clear()
     print("Instance started successfully.")
 
 if __name__ == "__main__":
-    with open('input.json') as f:
-        inputs = json.load(f)
+    inputs = read_json('input.json')
 
     instance_id = inputs['instance_id']
     region = inputs['region']
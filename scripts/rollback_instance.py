@@ -1,27 +1,44 @@
-import boto3
 import json
-import time
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from aws_common import get_client, describe_instance, WAITER_CONFIG
+from json_utils import read_json
 
-def get_root_volume_id(ec2_client, instance_id):
-    """Finds the root volume ID and device name for the given instance."""
+def get_root_volume_id(instance_id, region):
+    """Finds the root volume ID, device name and availability zone for the given instance."""
     try:
-        response = ec2_client.describe_instances(InstanceIds=[instance_id])
-        instance = response['Reservations'][0]['Instances'][0]
+        instance = describe_instance(instance_id, region)
         
         for mapping in instance['BlockDeviceMappings']:
             if mapping['DeviceName'] == instance['RootDeviceName']:
-                return mapping['Ebs']['VolumeId'], mapping['DeviceName']
+                return mapping['Ebs']['VolumeId'], mapping['DeviceName'], instance['Placement']['AvailabilityZone']
     except Exception as e:
         print(f"Error finding root volume for instance {instance_id}: {e}")
-        return None, None
-    return None, None
+        return None, None, None
+    return None, None, None
+
+def discard_new_volume(ec2_client, new_volume_future):
+    """Deletes the volume created for the rollback, if create_volume got as far as returning one."""
+    try:
+        new_volume_id = new_volume_future.result().get('VolumeId')
+    except Exception:
+        return
+    if not new_volume_id:
+        return
+
+    print(f"Deleting unused new volume {new_volume_id}...")
+    try:
+        # A volume can only be deleted once it has left the creating state
+        ec2_client.get_waiter('volume_available').wait(VolumeIds=[new_volume_id], WaiterConfig=WAITER_CONFIG)
+        ec2_client.delete_volume(VolumeId=new_volume_id)
+        print(f"New volume {new_volume_id} deleted.")
+    except Exception as e:
+        print(f"Warning: Failed to delete new volume {new_volume_id}. Delete it manually. Error: {e}")
 
 def rollback_instance_with_snapshot():
     """Performs a snapshot-based rollback of an EC2 instance, including instance type change and cleanup."""
     try:
-        with open('rollback.json') as f:
-            data = json.load(f)
+        data = read_json('rollback.json')
     except (FileNotFoundError, json.JSONDecodeError) as e:
         print(f"Error reading rollback.json file: {e}")
         sys.exit(1)
@@ -35,55 +52,56 @@ def rollback_instance_with_snapshot():
         print("Required data (instance_id, region, original_instance_type, snapshot_ids) not found in rollback.json")
         sys.exit(1)
 
-    ec2 = boto3.client('ec2', region_name=region)
+    ec2 = get_client('ec2', region)
 
-    # 1. Stop the instance
-    print(f"Stopping instance {instance_id}...")
-    ec2.stop_instances(InstanceIds=[instance_id])
-    waiter = ec2.get_waiter('instance_stopped')
-    waiter.wait(InstanceIds=[instance_id])
-    print("Instance stopped.")
-
-    # 2. Get old volume details and create new volume
+    # 1. Get old volume details; the root volume mapping does not change while stopping
     print("Getting root volume details...")
-    old_volume_id, device_name = get_root_volume_id(ec2, instance_id)
+    old_volume_id, device_name, availability_zone = get_root_volume_id(instance_id, region)
     if not old_volume_id:
         print("Could not find the root volume ID. Aborting rollback.")
         sys.exit(1)
 
+    # 2. Stop the instance and create the new volume while it shuts down
+    print(f"Stopping instance {instance_id}...")
+    ec2.stop_instances(InstanceIds=[instance_id])
+    describe_instance.cache_clear()
+
     print(f"Creating a new volume from snapshot {snapshot_ids[0]}...")
-    try:
-        new_volume = ec2.create_volume(
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        new_volume_future = executor.submit(
+            ec2.create_volume,
             SnapshotId=snapshot_ids[0],
-            AvailabilityZone=ec2.describe_instances(InstanceIds=[instance_id])['Reservations'][0]['Instances'][0]['Placement']['AvailabilityZone']
+            AvailabilityZone=availability_zone
         )
-        new_volume_id = new_volume['VolumeId']
-        print(f"New volume {new_volume_id} created.")
-    except Exception as e:
-        print(f"Error creating new volume from snapshot: {e}")
-        sys.exit(1)
-
-    # Wait for the new volume to be available
-    waiter = ec2.get_waiter('volume_available')
-    waiter.wait(VolumeIds=[new_volume_id])
-
-    # 3. Detach the old volume
+        try:
+            waiter = ec2.get_waiter('instance_stopped')
+            waiter.wait(InstanceIds=[instance_id], WaiterConfig=WAITER_CONFIG)
+            print("Instance stopped.")
+            new_volume_id = new_volume_future.result()['VolumeId']
+            print(f"New volume {new_volume_id} created.")
+        except Exception as e:
+            print(f"Error stopping instance or creating new volume from snapshot: {e}")
+            discard_new_volume(ec2, new_volume_future)
+            sys.exit(1)
+
+    # 3. Detach the old volume, waiting for it and the new volume to become available together
     print(f"Detaching old volume {old_volume_id}...")
     ec2.detach_volume(VolumeId=old_volume_id, InstanceId=instance_id, Device=device_name)
     waiter = ec2.get_waiter('volume_available')
-    waiter.wait(VolumeIds=[old_volume_id])
+    waiter.wait(VolumeIds=[old_volume_id, new_volume_id], WaiterConfig=WAITER_CONFIG)
     print("Old volume detached.")
 
     # 4. Attach the new volume
     print(f"Attaching new volume {new_volume_id}...")
     ec2.attach_volume(VolumeId=new_volume_id, InstanceId=instance_id, Device=device_name)
     waiter = ec2.get_waiter('volume_in_use')
-    waiter.wait(VolumeIds=[new_volume_id])
+    waiter.wait(VolumeIds=[new_volume_id], WaiterConfig=WAITER_CONFIG)
     print("New volume attached.")
 
     # 5. Modify instance type
     print(f"Modifying instance {instance_id} to type {original_instance_type}...")
     ec2.modify_instance_attribute(InstanceId=instance_id, Attribute='instanceType', Value=original_instance_type)
+    describe_instance.cache_clear()
     print("Instance type changed.")
 
     # 6. Set the new volume to be deleted on termination
@@ -107,8 +125,9 @@ def rollback_instance_with_snapshot():
     # 7. Start the instance again
     print(f"Starting instance {instance_id}...")
     ec2.start_instances(InstanceIds=[instance_id])
+    describe_instance.cache_clear()
     waiter = ec2.get_waiter('instance_running')
-    waiter.wait(InstanceIds=[instance_id])
+    waiter.wait(InstanceIds=[instance_id], WaiterConfig=WAITER_CONFIG)
     print("Instance started. Rollback complete.")
 
     # 8. Cleanup
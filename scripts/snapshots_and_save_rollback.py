@@ -1,34 +1,40 @@
-import boto3
-import json
 import sys
-import time
+from concurrent.futures import ThreadPoolExecutor
+from aws_common import get_client, describe_instance
+from json_utils import write_json_atomic
 
 def create_snapshots_and_prepare_rollback(instance_id, region):
-    ec2 = boto3.client('ec2', region_name=region)
+    ec2 = get_client('ec2', region)
 
     # Get instance details
-    reservations = ec2.describe_instances(InstanceIds=[instance_id])['Reservations']
-    instance = reservations[0]['Instances'][0]
+    instance = describe_instance(instance_id, region)
     original_instance_type = instance['InstanceType']
 
     # Get attached EBS volumes
     volumes = [dev['Ebs']['VolumeId'] for dev in instance['BlockDeviceMappings'] if 'Ebs' in dev]
 
-    snapshot_ids = []
     print(f"Creating snapshots of attached volumes for instance {instance_id}...")
 
-    for vol_id in volumes:
+    def create_snapshot(vol_id):
         print(f"Creating snapshot for volume {vol_id}...")
         snapshot = ec2.create_snapshot(VolumeId=vol_id, Description=f"Rollback snapshot for {instance_id}")
-        snapshot_id = snapshot['SnapshotId']
-        snapshot_ids.append(snapshot_id)
+        return snapshot['SnapshotId']
+
+    # Snapshot requests are independent, so issue them concurrently
+    snapshot_ids = []
+    if volumes:
+        with ThreadPoolExecutor(max_workers=min(16, len(volumes))) as executor:
+            snapshot_ids = list(executor.map(create_snapshot, volumes))
 
-    # Wait for snapshots to complete (optional, can wait or skip)
+    # Wait for snapshots to complete (optional, can wait or skip). A single waiter
+    # call polls every snapshot in the same DescribeSnapshots request.
     print("Waiting for snapshots to complete...")
-    waiter = ec2.get_waiter('snapshot_completed')
-    for snap_id in snapshot_ids:
-        waiter.wait(SnapshotIds=[snap_id])
-        print(f"Snapshot {snap_id} completed.")
+    if snapshot_ids:
+        ec2.get_waiter('snapshot_completed').wait(
+            SnapshotIds=snapshot_ids,
+            WaiterConfig={'Delay': 5, 'MaxAttempts': 240}
+        )
+        print(f"Snapshots {', '.join(snapshot_ids)} completed.")
 
     rollback_data = {
         "instance_id": instance_id,
@@ -37,8 +43,7 @@ def create_snapshots_and_prepare_rollback(instance_id, region):
         "snapshot_ids": snapshot_ids
     }
 
-    with open('rollback.json', 'w') as f:
-        json.dump(rollback_data, f, indent=2)
+    write_json_atomic('rollback.json', rollback_data)
 
     print("Rollback data saved to rollback.json")
 
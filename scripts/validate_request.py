@@ -1,10 +1,9 @@
-import boto3
-import os
-import json
 import sys
-from datetime import datetime, timedelta
-from groq import Groq
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from aws_common import describe_instance, fetch_supported_architectures, _get_size_rank
+from groq_common import get_groq_client
+from json_utils import read_json, write_json
 
 load_dotenv()
 
@@ -12,12 +11,8 @@ load_dotenv()
 
 def fetch_instance_details(instance_id, region):
     """Fetches the current instance type and architecture."""
-    client = boto3.client('ec2', region_name=region)
     try:
-        reservations = client.describe_instances(InstanceIds=[instance_id])['Reservations']
-        if not reservations:
-            raise ValueError(f"Instance ID {instance_id} not found.")
-        instance = reservations[0]['Instances'][0]
+        instance = describe_instance(instance_id, region)
         # Boto3 does not have a direct attribute for OS, so we'll infer based on AMI or other data.
         # This is a placeholder; a more robust solution would involve checking the AMI name.
         os_info = instance.get('PlatformDetails', 'Linux/UNIX')
@@ -26,69 +21,10 @@ def fetch_instance_details(instance_id, region):
         print(f"Error fetching instance details: {e}")
         sys.exit(1)
 
-# ---------- Instance Types Cache ----------
-
-def fetch_available_instance_types(region, architecture, cache_file='instance_types_cache.json'):
-    """Fetches and caches all valid instance types for a given architecture and region."""
-    now = datetime.utcnow()
-    if os.path.exists(cache_file):
-        with open(cache_file) as f:
-            cache = json.load(f)
-            key = f"{region}_{architecture}"
-            if key in cache:
-                last_updated_str = cache[key].get('last_updated')
-                if last_updated_str:
-                    last_updated = datetime.strptime(last_updated_str, "%Y-%m-%dT%H:%M:%SZ")
-                    if now - last_updated < timedelta(hours=23):
-                        return cache[key]['instance_types']
-
-    ec2 = boto3.client('ec2', region_name=region)
-    paginator = ec2.get_paginator('describe_instance_types')
-    valid_types = []
-    for page in paginator.paginate():
-        for itype in page['InstanceTypes']:
-            if architecture in itype['ProcessorInfo']['SupportedArchitectures']:
-                valid_types.append(itype['InstanceType'])
-    
-    key = f"{region}_{architecture}"
-    if os.path.exists(cache_file):
-        with open(cache_file) as f:
-            cache = json.load(f)
-    else:
-        cache = {}
-
-    cache[key] = {
-        'last_updated': now.strftime("%Y-%m-%dT%H:%M:%SZ"),
-        'instance_types': valid_types
-    }
-
-    with open(cache_file, 'w') as f:
-        json.dump(cache, f, indent=2)
-
-    return valid_types
-
-def _get_size_rank(instance_type):
-    """Internal helper to get a numerical rank for instance size."""
-    sizes = ['nano', 'micro', 'small', 'medium', 'large', 'xlarge', '2xlarge', '4xlarge', '8xlarge', '16xlarge', '32xlarge', '48xlarge']
-    try:
-        size = instance_type.split('.')[1]
-        return sizes.index(size)
-    except (IndexError, ValueError):
-        return -1 # Return -1 for unknown sizes
-
 # ---------- Groq AI for Compatibility Analysis ----------
 
-def ai_analyze_compatibility(current_type, desired_type, architecture, os_info, valid_types):
-    """Uses Groq AI to analyze if the desired instance type is a compatible upgrade."""
-    client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
-
-    # Pre-computation based on original script's logic
-    is_requested_type_valid_for_arch = desired_type in valid_types
-    is_a_size_increase = _get_size_rank(desired_type) > _get_size_rank(current_type)
-    is_same_family = current_type.split('.')[0] == desired_type.split('.')[0]
-    is_downgrade = _get_size_rank(desired_type) < _get_size_rank(current_type) and is_same_family
-
-    prompt = f"""You are an expert AWS solutions architect.
+# Built once at import; ai_analyze_compatibility only fills in the placeholders.
+_PROMPT_TEMPLATE = """You are an expert AWS solutions architect.
 Your task is to analyze an EC2 instance resize request.
 Current instance type: {current_type}
 Desired instance type: {desired_type}
@@ -96,9 +32,9 @@ Operating System: {os_info}
 Architecture: {architecture}
 
 # --- Factual Analysis from our Script ---
-1. The requested instance type is {'' if is_requested_type_valid_for_arch else 'NOT '}available for this architecture.
-2. The requested change is a {'' if is_a_size_increase else 'downgrade or side-grade'} in size.
-3. The current and desired instance types {'are in the same family' if is_same_family else 'are in DIFFERENT families'}.
+1. The requested instance type is {availability}available for this architecture.
+2. The requested change is a {size_change} in size.
+3. The current and desired instance types {family_relation}.
 # --------------------------------------------------
 
 Based on the provided facts and your knowledge of AWS best practices, determine if the desired instance type is a valid and logical upgrade.
@@ -137,6 +73,39 @@ Response: NOT_VALID. This is a downgrade in size within the same instance family
 Your response should follow the format 'VALID/NOT_VALID. [Reason].'
 """
 
+# The single compatibility answer can run longer than the analyzers' short JSON
+# suggestions, so validation allows 30s instead of the 20s default.
+_GROQ_TIMEOUT = 30.0
+
+def ai_analyze_compatibility(current_type, desired_type, architecture, os_info, supported_architectures):
+    """Uses Groq AI to analyze if the desired instance type is a compatible upgrade."""
+    # Pre-computation based on original script's logic
+    is_requested_type_valid_for_arch = architecture in supported_architectures
+    current_rank, desired_rank = _get_size_rank(current_type), _get_size_rank(desired_type)
+    is_a_size_increase = desired_rank > current_rank
+    is_same_family = current_type.split('.')[0] == desired_type.split('.')[0]
+    # Unranked sizes such as metal can't be ordered, so only known sizes count as a downgrade
+    is_downgrade = current_rank >= 0 and desired_rank >= 0 and desired_rank < current_rank and is_same_family
+
+    # Skip the LLM when the facts above already decide the outcome.
+    if not is_requested_type_valid_for_arch:
+        return "NOT_VALID. Requested type not available for architecture."
+    if current_type == desired_type:
+        return "NOT_VALID. No change requested."
+    if is_downgrade:
+        return "NOT_VALID. Downgrade within same family."
+
+    prompt = _PROMPT_TEMPLATE.format(
+        current_type=current_type,
+        desired_type=desired_type,
+        os_info=os_info,
+        architecture=architecture,
+        availability='' if is_requested_type_valid_for_arch else 'NOT ',
+        size_change='' if is_a_size_increase else 'downgrade or side-grade',
+        family_relation='are in the same family' if is_same_family else 'are in DIFFERENT families'
+    )
+
+    client = get_groq_client(_GROQ_TIMEOUT)
     chat_completion = client.chat.completions.create(
         messages=[{"role": "user", "content": prompt}],
         model="llama3-70b-8192"
@@ -156,9 +125,8 @@ if __name__ == "__main__":
     
     # Load input data
     try:
-        with open(input_file_path) as f:
-            input_data = json.load(f)
-        
+        input_data = read_json(input_file_path)
+
         instance_id = input_data['instance_id']
         region = input_data['region']
         desired_instance_type = input_data['desired_instance_type']
@@ -166,11 +134,13 @@ if __name__ == "__main__":
         print(f"Error loading input file: {e}")
         sys.exit(1)
 
-    # Fetch existing instance stats (without CPU)
-    current_instance_type, architecture, os_info = fetch_instance_details(instance_id, region)
-    
-    # Create list of available compatible instance types
-    valid_instance_types = fetch_available_instance_types(region, architecture)
+    # Fetch existing instance stats (without CPU) while looking up which
+    # architectures the requested type supports
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        details_future = executor.submit(fetch_instance_details, instance_id, region)
+        architectures_future = executor.submit(fetch_supported_architectures, desired_instance_type, region)
+        current_instance_type, architecture, os_info = details_future.result()
+        supported_architectures = architectures_future.result()
 
     print("\n--- EC2 Instance Analysis ---")
     print(f"Current Instance Type: {current_instance_type}")
@@ -180,7 +150,7 @@ if __name__ == "__main__":
     
     # Authenticate and use AI
     print("\n--- AI Compatibility Check ---")
-    ai_response = ai_analyze_compatibility(current_instance_type, desired_instance_type, architecture, os_info, valid_instance_types)
+    ai_response = ai_analyze_compatibility(current_instance_type, desired_instance_type, architecture, os_info, supported_architectures)
     
     decision, *reason_parts = ai_response.split('.', 1)
     reason = reason_parts[0].strip() if reason_parts else "No reason provided."
@@ -203,7 +173,6 @@ if __name__ == "__main__":
         "is_valid_upgrade": is_valid
     }
 
-    with open("resize_validation.json", "w") as f:
-        json.dump(result, f, indent=2)
+    write_json("resize_validation.json", result)
 
     print("\n✅ Output saved to resize_validation.json")